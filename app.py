@@ -4,16 +4,29 @@ TradeJoy - Voice-First AI Business Companion
 Flask backend server for lightweight storefront management
 """
 
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory
 from flask_cors import CORS
+from werkzeug.datastructures import MIMEAccept
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime, timedelta
+from pathlib import Path
+import click
 import sqlite3
 import json
+import gzip
+import hashlib
 import os
 import logging
+import threading
+import time
 from typing import Dict, List, Optional
 import re
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field, replace
+
+try:
+    import msgpack
+except ImportError:  # MessagePack responses are optional
+    msgpack = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -23,9 +36,27 @@ app = Flask(__name__)
 CORS(app)
 
 # Configuration
-DATABASE_PATH = 'tradejoy.db'
+DATABASE_PATH = os.environ.get('TRADEJOY_DB', 'tradejoy.db')
 UPLOAD_FOLDER = 'uploads'
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file upload
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+COLUMNAR_MIMETYPE = 'application/vnd.tradejoy.columnar+json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+GZIP_MIN_BYTES = 512  # smaller bodies don't win back the gzip header
+TRANSACTION_COLUMNS = ('id', 'type', 'amount', 'description', 'category', 'timestamp', 'date')
+RECOMPUTE_MAX_ATTEMPTS = 3  # per partition, when its ledger changes mid-run
+
+# Built-in category rules as (transaction_type, category, keywords), highest
+# priority first. 'any' rules apply to both sales and expenses.
+DEFAULT_CATEGORY_RULES = [
+    ('sale', 'product-sale', ['vegetables', 'fruits', 'food', 'products', 'items', 'goods']),
+    ('any', 'service', ['service', 'repair', 'consultation', 'work']),
+    ('expense', 'supplies', ['supplies', 'materials', 'inventory', 'stock']),
+    ('any', 'transport', ['transport', 'taxi', 'bus', 'fuel', 'petrol', 'gas']),
+    ('expense', 'food', ['food', 'lunch', 'dinner', 'snacks', 'tea', 'coffee']),
+    ('expense', 'utilities', ['electricity', 'water', 'phone', 'internet', 'rent'])
+]
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
@@ -59,6 +90,7 @@ class DatabaseManager:
     
     def __init__(self, db_path: str):
         self.db_path = db_path
+        self.fts_enabled = False
         self.init_database()
     
     def init_database(self):
@@ -78,9 +110,30 @@ class DatabaseManager:
                         category TEXT NOT NULL,
                         timestamp TEXT NOT NULL,
                         date TEXT NOT NULL,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        category_source TEXT NOT NULL DEFAULT 'client',
+                        source_text TEXT
                     )
                 ''')
+                # category_source is 'rules' when the category rules picked the
+                # category and source_text is what they were matched against;
+                # only those rows are recategorized by default
+                added = self._add_missing_columns(cursor, 'transactions', {
+                    'category_source': "TEXT NOT NULL DEFAULT 'client'",
+                    'source_text': 'TEXT'
+                })
+                if 'category_source' in added:
+                    # Rows recorded before the column existed could have come from
+                    # either path; recategorizing them takes an explicit opt-in
+                    cursor.execute("UPDATE transactions SET category_source = 'legacy'")
+                
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_transactions_user_date
+                    ON transactions (user_id, date)
+                ''')
+                
+                # Full-text index over description and category
+                self.fts_enabled = self._init_search_index(cursor)
                 
                 # Create milestones table
                 cursor.execute('''
@@ -107,6 +160,119 @@ class DatabaseManager:
                     )
                 ''')
                 
+                # Create idempotency_keys table (dedup for retried writes)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS idempotency_keys (
+                        user_id TEXT NOT NULL,
+                        idempotency_key TEXT NOT NULL,
+                        endpoint TEXT NOT NULL,
+                        transaction_id INTEGER NOT NULL,
+                        transaction_data TEXT NOT NULL,
+                        request_hash TEXT NOT NULL,
+                        created_at TEXT NOT NULL,
+                        PRIMARY KEY (user_id, idempotency_key)
+                    ) WITHOUT ROWID
+                ''')
+                
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at
+                    ON idempotency_keys (created_at)
+                ''')
+                
+                # Create achievement_progress table (running totals behind milestones)
+                cursor.execute('''
+                    SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'achievement_progress'
+                ''')
+                progress_exists = cursor.fetchone() is not None
+                
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS achievement_progress (
+                        user_id TEXT PRIMARY KEY,
+                        total_sales REAL NOT NULL DEFAULT 0,
+                        total_transactions INTEGER NOT NULL DEFAULT 0,
+                        sale_day TEXT,
+                        day_sales REAL NOT NULL DEFAULT 0,
+                        last_sale_date TEXT,
+                        streak_days INTEGER NOT NULL DEFAULT 0,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                if not progress_exists:
+                    users = AchievementsEngine.rebuild(cursor)
+                    logger.info(f"Achievement progress backfilled for {users} users")
+                
+                # Create daily_rollups table (per-day totals for analytics and forecasting)
+                cursor.execute('''
+                    SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_rollups'
+                ''')
+                rollups_exist = cursor.fetchone() is not None
+                
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS daily_rollups (
+                        user_id TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        sales REAL NOT NULL DEFAULT 0,
+                        expenses REAL NOT NULL DEFAULT 0,
+                        transaction_count INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (user_id, date)
+                    ) WITHOUT ROWID
+                ''')
+                
+                # Bumped whenever a user's past rollups change, so every process
+                # can tell when its cached forecast model is stale
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS daily_rollup_versions (
+                        user_id TEXT PRIMARY KEY,
+                        version INTEGER NOT NULL DEFAULT 0
+                    )
+                ''')
+                
+                if not rollups_exist:
+                    self.rebuild_daily_rollups(cursor)
+                    logger.info("Daily rollups backfilled from existing transactions")
+                
+                # Create category_rules table (keyword rules per business type, '' = defaults)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS category_rules (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        business_type TEXT NOT NULL DEFAULT '',
+                        transaction_type TEXT NOT NULL DEFAULT 'any',
+                        category TEXT NOT NULL,
+                        keyword TEXT NOT NULL,
+                        priority INTEGER NOT NULL DEFAULT 0,
+                        UNIQUE(business_type, transaction_type, keyword)
+                    )
+                ''')
+                
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS category_rule_versions (
+                        business_type TEXT PRIMARY KEY,
+                        version INTEGER NOT NULL DEFAULT 0
+                    )
+                ''')
+                
+                # Seed the defaults once; an emptied default rule set stays empty
+                cursor.execute("SELECT 1 FROM category_rule_versions WHERE business_type = ''")
+                if cursor.fetchone() is None:
+                    cursor.executemany('''
+                        INSERT INTO category_rules
+                        (business_type, transaction_type, category, keyword, priority)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', CategoryMatcher.default_rule_rows())
+                    cursor.execute('''
+                        INSERT INTO category_rule_versions (business_type, version) VALUES ('', 1)
+                    ''')
+                
+                # Create merchant_reports table (written by the recompute-analytics batch job)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS merchant_reports (
+                        user_id TEXT PRIMARY KEY,
+                        report TEXT NOT NULL,
+                        generated_at TEXT NOT NULL
+                    )
+                ''')
+                
                 conn.commit()
                 logger.info("Database initialized successfully")
                 
@@ -114,15 +280,107 @@ class DatabaseManager:
             logger.error(f"Database initialization error: {e}")
             raise
     
-    def add_transaction(self, transaction: Transaction) -> int:
-        """Add a new transaction"""
+    @staticmethod
+    def _add_missing_columns(cursor, table: str, columns: Dict[str, str]) -> List[str]:
+        """Add columns introduced after a table was first created, returning the ones added"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        existing = {row[1] for row in cursor.fetchall()}
+        added = []
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+                logger.info(f"Added column {table}.{name}")
+                added.append(name)
+        return added
+    
+    @staticmethod
+    def recategorizable_condition(include_legacy: bool = False) -> str:
+        """SQL condition for transactions whose category the rules may rewrite"""
+        if not include_legacy:
+            return "category_source = 'rules'"
+        # Legacy voice entries only kept a placeholder description, so there
+        # is nothing to match them against
+        return ("(category_source = 'rules' OR (category_source = 'legacy'"
+                " AND description NOT LIKE 'Voice recorded %'))")
+    
+    def _init_search_index(self, cursor) -> bool:
+        """Create the per-merchant FTS5 search index, backfilling it on first creation"""
+        cursor.execute('''
+            SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transaction_terms'
+        ''')
+        exists = cursor.fetchone() is not None
+        
+        # Contentless index of owner-prefixed tokens ("u<hex user id>x<word>"),
+        # so each merchant's words get their own posting lists and a prefix
+        # query only reads the calling merchant's slice of the term index
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS transaction_terms USING fts5(
+                    terms,
+                    content=''
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 unavailable, falling back to LIKE search: {e}")
+            return False
+        
+        if not exists:
+            cursor.execute('SELECT id, user_id, description, category FROM transactions')
+            self._index_search_terms(cursor, cursor.fetchall())
+            logger.info("Search index built from existing transactions")
+        
+        return True
+    
+    @staticmethod
+    def _search_owner(user_id: str) -> str:
+        """Token prefix that scopes search terms to one merchant"""
+        return 'u' + user_id.encode('utf-8').hex() + 'x'
+    
+    @classmethod
+    def _search_document(cls, user_id: str, description: str, category: str) -> str:
+        """Owner-prefixed tokens indexed for one transaction"""
+        owner = cls._search_owner(user_id)
+        return ' '.join(owner + term for term in cls._search_terms(f'{description} {category}'))
+    
+    @classmethod
+    def _index_search_terms(cls, cursor, rows: List[tuple], delete: bool = False) -> None:
+        """Add (or remove) (id, user_id, description, category) rows in the search index"""
+        # A contentless index can only remove a row given the exact tokens it was indexed with
+        if delete:
+            sql = "INSERT INTO transaction_terms (transaction_terms, rowid, terms) VALUES ('delete', ?, ?)"
+        else:
+            sql = 'INSERT INTO transaction_terms (rowid, terms) VALUES (?, ?)'
+        cursor.executemany(sql, [
+            (row_id, cls._search_document(user_id, description, category))
+            for row_id, user_id, description, category in rows
+        ])
+    
+    def add_transaction(self, transaction: Transaction,
+                        idempotency_key: Optional[str] = None,
+                        endpoint: Optional[str] = None,
+                        request_hash: Optional[str] = None,
+                        category_source: str = 'client',
+                        source_text: Optional[str] = None) -> int:
+        """Add a new transaction, optionally recording the request's idempotency key"""
+        if idempotency_key and not request_hash:
+            raise ValueError("An idempotency key must be stored with its request hash")
+        
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
+                
+                if idempotency_key:
+                    # Expired keys are dropped here so they can be reused
+                    cutoff = (datetime.now() - IDEMPOTENCY_KEY_TTL).isoformat()
+                    cursor.execute('''
+                        DELETE FROM idempotency_keys WHERE created_at < ?
+                    ''', (cutoff,))
+                
                 cursor.execute('''
                     INSERT INTO transactions 
-                    (user_id, type, amount, description, category, timestamp, date)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    (user_id, type, amount, description, category, timestamp, date,
+                     category_source, source_text)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (
                     transaction.user_id,
                     transaction.type,
@@ -130,10 +388,41 @@ class DatabaseManager:
                     transaction.description,
                     transaction.category,
                     transaction.timestamp,
-                    transaction.date
+                    transaction.date,
+                    category_source,
+                    source_text
                 ))
                 
                 transaction_id = cursor.lastrowid
+                
+                if self.fts_enabled:
+                    self._index_search_terms(cursor, [(transaction_id, transaction.user_id,
+                                                       transaction.description, transaction.category)])
+                
+                self._update_daily_rollup(cursor, transaction.user_id, transaction.type,
+                                          transaction.amount, transaction.date)
+                AchievementsEngine.record_transaction(cursor, transaction)
+                
+                if idempotency_key:
+                    # Raises IntegrityError (rolling back the insert) if a
+                    # concurrent retry with the same key committed first
+                    snapshot = asdict(transaction)
+                    snapshot['id'] = transaction_id
+                    cursor.execute('''
+                        INSERT INTO idempotency_keys
+                        (user_id, idempotency_key, endpoint, transaction_id, transaction_data,
+                         request_hash, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        transaction.user_id,
+                        idempotency_key,
+                        endpoint or '',
+                        transaction_id,
+                        json.dumps(snapshot),
+                        request_hash,
+                        datetime.now().isoformat()
+                    ))
+                
                 conn.commit()
                 logger.info(f"Transaction added: ID {transaction_id}")
                 return transaction_id
@@ -142,6 +431,30 @@ class DatabaseManager:
             logger.error(f"Error adding transaction: {e}")
             raise
     
+    def get_idempotent_transaction(self, user_id: str, idempotency_key: str) -> Optional[Dict]:
+        """Look up the transaction an earlier request with this key created"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cutoff = (datetime.now() - IDEMPOTENCY_KEY_TTL).isoformat()
+                cursor.execute('''
+                    SELECT endpoint, transaction_data, request_hash FROM idempotency_keys
+                    WHERE user_id = ? AND idempotency_key = ? AND created_at >= ?
+                ''', (user_id, idempotency_key, cutoff))
+                
+                row = cursor.fetchone()
+                if row:
+                    return {
+                        'endpoint': row[0],
+                        'transaction': json.loads(row[1]),
+                        'request_hash': row[2]
+                    }
+                return None
+                
+        except Exception as e:
+            logger.error(f"Error fetching idempotency key: {e}")
+            raise
+    
     def get_transactions(self, user_id: str, limit: int = 50) -> List[Dict]:
         """Get user transactions"""
         try:
@@ -155,8 +468,7 @@ class DatabaseManager:
                     LIMIT ?
                 ''', (user_id, limit))
                 
-                columns = ['id', 'type', 'amount', 'description', 'category', 'timestamp', 'date']
-                transactions = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                transactions = [dict(zip(TRANSACTION_COLUMNS, row)) for row in cursor.fetchall()]
                 
                 return transactions
                 
@@ -164,17 +476,103 @@ class DatabaseManager:
             logger.error(f"Error fetching transactions: {e}")
             return []
     
+    @staticmethod
+    def _search_terms(query: str) -> List[str]:
+        """Split a free-text query into lowercase search terms"""
+        # Underscores are excluded so terms match the FTS5 tokenizer's words
+        return re.findall(r'[^\W_]+', query.lower())
+    
+    def search_transactions(self, user_id: str, query: str,
+                            transaction_type: Optional[str] = None,
+                            start_date: Optional[str] = None,
+                            end_date: Optional[str] = None,
+                            limit: int = 20, offset: int = 0) -> Dict:
+        """Search transaction descriptions and categories, best matches first"""
+        terms = self._search_terms(query)
+        if not terms:
+            return {'transactions': [], 'total': 0}
+        
+        filters = ['t.user_id = ?']
+        params: List = [user_id]
+        if transaction_type:
+            filters.append('t.type = ?')
+            params.append(transaction_type)
+        if start_date:
+            filters.append('t.date >= ?')
+            params.append(start_date)
+        if end_date:
+            filters.append('t.date <= ?')
+            params.append(end_date)
+        
+        if self.fts_enabled:
+            # Every term must match, each as a prefix ("tom" finds "Tomatoes");
+            # the owner prefix keeps the scan inside this merchant's terms
+            owner = self._search_owner(user_id)
+            match = ' '.join(f'"{owner}{term}"*' for term in terms)
+            source = '''
+                FROM transaction_terms
+                CROSS JOIN transactions t ON t.id = transaction_terms.rowid
+                WHERE transaction_terms MATCH ? AND ''' + ' AND '.join(filters)
+            params = [match] + params
+            score = 'bm25(transaction_terms)'
+        else:
+            for term in terms:
+                filters.append("(LOWER(t.description) LIKE ? OR LOWER(t.category) LIKE ?)")
+                params.extend([f'%{term}%', f'%{term}%'])
+            source = 'FROM transactions t WHERE ' + ' AND '.join(filters)
+            score = '0'
+        
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'SELECT COUNT(*) {source}', params)
+                total = cursor.fetchone()[0]
+                
+                cursor.execute(f'''
+                    SELECT t.id, t.type, t.amount, t.description, t.category, t.timestamp, t.date,
+                           {score} AS score
+                    {source}
+                    ORDER BY score, t.timestamp DESC
+                    LIMIT ? OFFSET ?
+                ''', params + [limit, offset])
+                
+                transactions = [dict(zip(TRANSACTION_COLUMNS, row[:-1])) for row in cursor.fetchall()]
+                
+                return {'transactions': transactions, 'total': total}
+                
+        except Exception as e:
+            logger.error(f"Error searching transactions: {e}")
+            raise
+    
     def delete_transaction(self, transaction_id: int, user_id: str) -> bool:
         """Delete a transaction"""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
+                
+                if self.fts_enabled:
+                    cursor.execute('''
+                        SELECT id, user_id, description, category FROM transactions
+                        WHERE id = ? AND user_id = ?
+                    ''', (transaction_id, user_id))
+                    self._index_search_terms(cursor, cursor.fetchall(), delete=True)
+                
+                cursor.execute('''
+                    SELECT type, amount, date FROM transactions
+                    WHERE id = ? AND user_id = ?
+                ''', (transaction_id, user_id))
+                row = cursor.fetchone()
+                
                 cursor.execute('''
-                    DELETE FROM transactions 
+                    DELETE FROM transactions
                     WHERE id = ? AND user_id = ?
                 ''', (transaction_id, user_id))
                 
                 deleted = cursor.rowcount > 0
+                if deleted:
+                    transaction_type, amount, date = row
+                    self._update_daily_rollup(cursor, user_id, transaction_type, amount, date, sign=-1)
+                    AchievementsEngine.forget_transaction(cursor, user_id, transaction_type, amount, date)
                 conn.commit()
                 logger.info(f"Transaction {transaction_id} deleted: {deleted}")
                 return deleted
@@ -183,6 +581,66 @@ class DatabaseManager:
             logger.error(f"Error deleting transaction: {e}")
             return False
     
+    @staticmethod
+    def _update_daily_rollup(cursor, user_id: str, transaction_type: str, amount: float,
+                             date: str, sign: int = 1) -> None:
+        """Add (sign=1) or remove (sign=-1) one transaction from its day's totals"""
+        # Forecast models only learn from completed days, so today's writes keep them valid
+        if date < datetime.now().strftime('%Y-%m-%d'):
+            DatabaseManager.bump_rollup_versions(cursor, [user_id])
+        sales = amount * sign if transaction_type == 'sale' else 0.0
+        expenses = amount * sign if transaction_type == 'expense' else 0.0
+        cursor.execute('''
+            INSERT INTO daily_rollups (user_id, date, sales, expenses, transaction_count)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, date) DO UPDATE SET
+                sales = sales + excluded.sales,
+                expenses = expenses + excluded.expenses,
+                transaction_count = transaction_count + excluded.transaction_count
+        ''', (user_id, date, sales, expenses, sign))
+    
+    @staticmethod
+    def rebuild_daily_rollups(cursor, user_ids: Optional[List[str]] = None) -> None:
+        """Recompute daily rollups from the ledger for some or all users"""
+        where, params = '', []
+        if user_ids is not None:
+            where = f"WHERE user_id IN ({', '.join('?' for _ in user_ids)})"
+            params = list(user_ids)
+        cursor.execute(f'DELETE FROM daily_rollups {where}', params)
+        cursor.execute(f'''
+            INSERT INTO daily_rollups (user_id, date, sales, expenses, transaction_count)
+            SELECT user_id, date,
+                   SUM(CASE WHEN type = 'sale' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+                   COUNT(*)
+            FROM transactions {where}
+            GROUP BY user_id, date
+        ''', params)
+        DatabaseManager.bump_rollup_versions(cursor, user_ids)
+    
+    @staticmethod
+    def bump_rollup_versions(cursor, user_ids: Optional[List[str]] = None) -> None:
+        """Mark some or all users' past rollups as changed"""
+        if user_ids is None:
+            cursor.execute('''
+                SELECT user_id FROM daily_rollups UNION SELECT user_id FROM daily_rollup_versions
+            ''')
+            user_ids = [row[0] for row in cursor.fetchall()]
+        cursor.executemany('''
+            INSERT INTO daily_rollup_versions (user_id, version) VALUES (?, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+        ''', [(user_id,) for user_id in user_ids])
+    
+    def get_forecast(self, user_id: str) -> Dict:
+        """Project today's and this week's results against the user's targets"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                return SalesForecaster.forecast(conn.cursor(), user_id, datetime.now())
+                
+        except Exception as e:
+            logger.error(f"Error computing forecast: {e}")
+            raise
+    
     def get_business_stats(self, user_id: str) -> BusinessStats:
         """Calculate business statistics"""
         try:
@@ -287,12 +745,401 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Error updating business profile: {e}")
             return False
+    
+    def update_categories(self, cursor, changes: List[tuple]) -> int:
+        """Apply (category, transaction_id, old_category) changes as set-based updates, keeping search in sync"""
+        if not changes:
+            return 0
+        
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS category_changes (
+                id INTEGER PRIMARY KEY,
+                category TEXT NOT NULL,
+                old_category TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('DELETE FROM category_changes')
+        cursor.executemany('''
+            INSERT INTO category_changes (category, id, old_category) VALUES (?, ?, ?)
+        ''', changes)
+        
+        # A row whose category changed since it was read was recategorized by
+        # someone else in the meantime; their newer category wins
+        cursor.execute('''
+            DELETE FROM category_changes
+            WHERE id NOT IN (
+                SELECT c.id FROM category_changes c
+                JOIN transactions t ON t.id = c.id AND t.category = c.old_category
+            )
+        ''')
+        cursor.execute('SELECT COUNT(*) FROM category_changes')
+        applied = cursor.fetchone()[0]
+        
+        indexed_rows = '''
+            SELECT t.id, t.user_id, t.description, t.category
+            FROM category_changes c JOIN transactions t ON t.id = c.id
+        '''
+        if self.fts_enabled:
+            cursor.execute(indexed_rows)
+            self._index_search_terms(cursor, cursor.fetchall(), delete=True)
+        
+        cursor.execute('''
+            UPDATE transactions
+            SET category = (SELECT c.category FROM category_changes c WHERE c.id = transactions.id)
+            WHERE id IN (SELECT id FROM category_changes)
+        ''')
+        
+        if self.fts_enabled:
+            cursor.execute(indexed_rows)
+            self._index_search_terms(cursor, cursor.fetchall())
+        
+        cursor.execute('DELETE FROM category_changes')
+        return applied
+    
+    def write_recompute_results(self, result: Dict) -> Optional[int]:
+        """Write one partition's results in one transaction; None (nothing written) if its ledger moved"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                user_ids = result['user_ids']
+                placeholders = ', '.join('?' for _ in user_ids)
+                
+                # Take the write lock before checking, so no transaction can land
+                # between the check and the rollups/progress overwritten below
+                cursor.execute('BEGIN IMMEDIATE')
+                if _partition_fingerprint(cursor, user_ids) != result['fingerprint']:
+                    conn.rollback()
+                    return None
+                
+                recategorized = self.update_categories(cursor, result['category_changes'])
+                
+                cursor.execute(f'DELETE FROM daily_rollups WHERE user_id IN ({placeholders})', user_ids)
+                cursor.executemany('''
+                    INSERT INTO daily_rollups (user_id, date, sales, expenses, transaction_count)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', result['rollups'])
+                self.bump_rollup_versions(cursor, user_ids)
+                
+                AchievementsEngine.save(cursor, result['achievements'])
+                
+                generated_at = datetime.now().isoformat()
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO merchant_reports (user_id, report, generated_at)
+                    VALUES (?, ?, ?)
+                ''', [(user_id, json.dumps(report), generated_at)
+                      for user_id, report in result['reports'].items()])
+                
+                # Reports were built from the worker's categories; rebuild their
+                # breakdowns if any of those changes lost to a newer edit
+                if recategorized < len(result['category_changes']):
+                    for user_id in result['reports']:
+                        self._refresh_report_categories(cursor, user_id)
+                
+                conn.commit()
+                return recategorized
+                
+        except Exception as e:
+            logger.error(f"Error writing recompute results: {e}")
+            raise
+    
+    def get_merchant_report(self, user_id: str) -> Optional[Dict]:
+        """Get the latest precomputed merchant report"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT report, generated_at FROM merchant_reports WHERE user_id = ?
+                ''', (user_id,))
+                
+                row = cursor.fetchone()
+                if row:
+                    return dict(json.loads(row[0]), generated_at=row[1])
+                return None
+                
+        except Exception as e:
+            logger.error(f"Error fetching merchant report: {e}")
+            raise
+    
+    def get_category_matcher(self, user_id: str, fallback: bool = True) -> 'CategoryMatcher':
+        """Get the compiled category rules for the user's business type"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT business_type FROM business_profiles WHERE user_id = ?
+                ''', (user_id,))
+                row = cursor.fetchone()
+                business_type = CategoryMatcher.normalize_business_type(row[0] if row else None)
+                return CategoryMatcher.for_business_type(cursor, business_type)
+                
+        except Exception as e:
+            logger.error(f"Error loading category rules: {e}")
+            # Bulk rewrites must not silently fall back to the built-in rules
+            if not fallback:
+                raise
+            return CategoryMatcher.default()
+    
+    def get_category_rules(self, business_type: str) -> Dict:
+        """Get the stored category rules for a business type"""
+        business_type = CategoryMatcher.normalize_business_type(business_type)
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT transaction_type, category, keyword, priority FROM category_rules
+                    WHERE business_type = ?
+                    ORDER BY priority DESC, category, keyword
+                ''', (business_type,))
+                
+                columns = ['transaction_type', 'category', 'keyword', 'priority']
+                rules = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                
+                cursor.execute('''
+                    SELECT version FROM category_rule_versions WHERE business_type = ?
+                ''', (business_type,))
+                row = cursor.fetchone()
+                
+                return {
+                    'business_type': business_type,
+                    'version': row[0] if row else 0,
+                    'rules': rules
+                }
+                
+        except Exception as e:
+            logger.error(f"Error fetching category rules: {e}")
+            raise
+    
+    def replace_category_rules(self, business_type: str, rules: List[Dict]) -> int:
+        """Replace a business type's category rules, returning the new rule version"""
+        business_type = CategoryMatcher.normalize_business_type(business_type)
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM category_rules WHERE business_type = ?', (business_type,))
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO category_rules
+                    (business_type, transaction_type, category, keyword, priority)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [(
+                    business_type,
+                    rule.get('transaction_type', 'any'),
+                    rule['category'],
+                    rule['keyword'].strip().lower(),
+                    int(rule.get('priority', 0))
+                ) for rule in rules])
+                
+                cursor.execute('''
+                    INSERT INTO category_rule_versions (business_type, version) VALUES (?, 1)
+                    ON CONFLICT (business_type) DO UPDATE SET version = version + 1
+                ''', (business_type,))
+                cursor.execute('''
+                    SELECT version FROM category_rule_versions WHERE business_type = ?
+                ''', (business_type,))
+                version = cursor.fetchone()[0]
+                
+                conn.commit()
+                logger.info(f"Category rules for '{business_type}' updated to version {version}")
+                return version
+                
+        except Exception as e:
+            logger.error(f"Error updating category rules: {e}")
+            raise
+    
+    def recategorize_transactions(self, user_id: str, since: Optional[str] = None,
+                                  include_legacy: bool = False, chunk_size: int = 500) -> Dict:
+        """Re-apply the user's category rules to past rule-categorized transactions, one chunk per commit"""
+        matcher = self.get_category_matcher(user_id, fallback=False)
+        scanned = updated = 0
+        last_id = 0
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                while True:
+                    cursor.execute(f'''
+                        SELECT id, type, COALESCE(source_text, description), category
+                        FROM transactions
+                        WHERE user_id = ? AND id > ? AND {self.recategorizable_condition(include_legacy)}
+                              {'AND date >= ?' if since else ''}
+                        ORDER BY id
+                        LIMIT ?
+                    ''', [user_id, last_id] + ([since] if since else []) + [chunk_size])
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    
+                    changes = []
+                    for transaction_id, transaction_type, text, category in rows:
+                        new_category = matcher.categorize(text, transaction_type)
+                        if new_category != category:
+                            changes.append((new_category, transaction_id, category))
+                    
+                    applied = self.update_categories(cursor, changes)
+                    conn.commit()
+                    
+                    scanned += len(rows)
+                    updated += applied
+                    last_id = rows[-1][0]
+                
+                if updated:
+                    self._refresh_report_categories(cursor, user_id)
+                    conn.commit()
+                
+                logger.info(f"Recategorized {updated} of {scanned} transactions for {user_id}")
+                return {'scanned': scanned, 'updated': updated}
+                
+        except Exception as e:
+            logger.error(f"Error recategorizing transactions: {e}")
+            raise
+    
+    @staticmethod
+    def _refresh_report_categories(cursor, user_id: str) -> None:
+        """Update the category breakdown of a stored merchant report after recategorization"""
+        cursor.execute('SELECT report FROM merchant_reports WHERE user_id = ?', (user_id,))
+        row = cursor.fetchone()
+        if not row:
+            return
+        
+        cursor.execute('''
+            SELECT category, SUM(amount) as total
+            FROM transactions
+            WHERE user_id = ? AND type = 'sale'
+            GROUP BY category
+            ORDER BY total DESC
+        ''', (user_id,))
+        report = json.loads(row[0])
+        report['category_breakdown'] = [{'category': r[0], 'amount': r[1]} for r in cursor.fetchall()]
+        cursor.execute('''
+            UPDATE merchant_reports SET report = ?, generated_at = ? WHERE user_id = ?
+        ''', (json.dumps(report), datetime.now().isoformat(), user_id))
+    
+    def get_milestones(self, user_id: str) -> Dict:
+        """Get achieved milestones and the progress behind them"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT milestone_type, achieved_at FROM milestones
+                    WHERE user_id = ?
+                    ORDER BY achieved_at, id
+                ''', (user_id,))
+                
+                milestones = [{
+                    'milestone_type': row[0],
+                    'description': AchievementsEngine.MILESTONES.get(row[0], row[0]),
+                    'achieved_at': row[1]
+                } for row in cursor.fetchall()]
+                
+                progress = AchievementsEngine.load_state(cursor, user_id)
+                
+                return {'milestones': milestones, 'progress': progress}
+                
+        except Exception as e:
+            logger.error(f"Error fetching milestones: {e}")
+            raise
+
+class CategoryMatcher:
+    """Compiled keyword index that maps transaction text to a category"""
+    
+    _cache: Dict[str, tuple] = {}  # business_type -> (rule versions, matcher)
+    _default = None
+    _lock = threading.Lock()
+    
+    def __init__(self, rules: List[tuple]):
+        """Build from (transaction_type, category, keyword, rank) rules; higher rank wins"""
+        self.keywords: Dict[str, Dict[str, tuple]] = {}
+        self.patterns = {}
+        for transaction_type in ('sale', 'expense'):
+            index: Dict[str, tuple] = {}
+            for rule_type, category, keyword, rank in rules:
+                keyword = keyword.strip().lower()
+                if rule_type in (transaction_type, 'any') and keyword:
+                    if keyword not in index or rank > index[keyword][0]:
+                        index[keyword] = (rank, category)
+            
+            self.keywords[transaction_type] = index
+            # Whole words with an optional plural, longest keywords first so
+            # "phone repair" beats "phone" and "bus" doesn't match "business"
+            alternatives = '|'.join(re.escape(k) for k in sorted(index, key=len, reverse=True))
+            self.patterns[transaction_type] = re.compile(rf'\b({alternatives})(?:e?s)?\b') if index else None
+    
+    def categorize(self, text: str, transaction_type: str) -> str:
+        """Category of the highest-ranked keyword found in text"""
+        pattern = self.patterns.get(transaction_type)
+        best = None
+        if pattern:
+            for match in pattern.finditer(text.lower()):
+                rank, category = self.keywords[transaction_type][match.group(1)]
+                if best is None or rank > best[0]:
+                    best = (rank, category)
+        if best:
+            return best[1]
+        
+        # Default categories
+        return 'product-sale' if transaction_type == 'sale' else 'supplies'
+    
+    @staticmethod
+    def normalize_business_type(business_type: Optional[str]) -> str:
+        """Rules are keyed by lowercase business type; '' holds the defaults"""
+        return (business_type or '').strip().lower()
+    
+    @staticmethod
+    def default_rule_rows() -> List[tuple]:
+        """DEFAULT_CATEGORY_RULES as (business_type, transaction_type, category, keyword, priority) rows"""
+        rows = []
+        for position, (transaction_type, category, keywords) in enumerate(DEFAULT_CATEGORY_RULES):
+            priority = (len(DEFAULT_CATEGORY_RULES) - position) * 10
+            rows += [('', transaction_type, category, keyword, priority) for keyword in keywords]
+        return rows
+    
+    @staticmethod
+    def from_rule_rows(rows: List[tuple], business_type: str) -> 'CategoryMatcher':
+        """Merge default and business-type rules, letting the business type's rules win"""
+        return CategoryMatcher([
+            (transaction_type, category, keyword, (bool(business_type) and rule_business_type == business_type, priority))
+            for rule_business_type, transaction_type, category, keyword, priority in rows
+        ])
+    
+    @staticmethod
+    def default() -> 'CategoryMatcher':
+        """Matcher for the built-in rules, used when no database rules apply"""
+        if CategoryMatcher._default is None:
+            CategoryMatcher._default = CategoryMatcher.from_rule_rows(CategoryMatcher.default_rule_rows(), '')
+        return CategoryMatcher._default
+    
+    @staticmethod
+    def load(cursor, business_type: str) -> 'CategoryMatcher':
+        """Compile a matcher from the stored rules for a business type"""
+        cursor.execute('''
+            SELECT business_type, transaction_type, category, keyword, priority
+            FROM category_rules WHERE business_type IN ('', ?)
+        ''', (business_type,))
+        return CategoryMatcher.from_rule_rows(cursor.fetchall(), business_type)
+    
+    @staticmethod
+    def for_business_type(cursor, business_type: str) -> 'CategoryMatcher':
+        """Cached matcher, recompiled only when the rule versions change"""
+        cursor.execute('''
+            SELECT business_type, version FROM category_rule_versions
+            WHERE business_type IN ('', ?)
+        ''', (business_type,))
+        found = dict(cursor.fetchall())
+        versions = (found.get('', 0), found.get(business_type, 0))
+        
+        with CategoryMatcher._lock:
+            cached = CategoryMatcher._cache.get(business_type)
+            if cached and cached[0] == versions:
+                return cached[1]
+        
+        matcher = CategoryMatcher.load(cursor, business_type)
+        with CategoryMatcher._lock:
+            CategoryMatcher._cache[business_type] = (versions, matcher)
+        return matcher
 
 class VoiceProcessor:
     """Processes voice commands and extracts transaction data"""
     
     @staticmethod
-    def process_voice_command(command: str) -> Optional[Transaction]:
+    def process_voice_command(command: str, matcher: Optional[CategoryMatcher] = None) -> Optional[Transaction]:
         """Process voice command and extract transaction details"""
         command_lower = command.lower()
         
@@ -332,7 +1179,7 @@ class VoiceProcessor:
         description = VoiceProcessor._extract_description(command, transaction_type)
         
         # Determine category
-        category = VoiceProcessor._categorize_transaction(command, transaction_type)
+        category = VoiceProcessor._categorize_transaction(command, transaction_type, matcher)
         
         return Transaction(
             type=transaction_type,
@@ -372,38 +1219,23 @@ class VoiceProcessor:
         return f"Voice recorded {transaction_type}"
     
     @staticmethod
-    def _categorize_transaction(command: str, transaction_type: str) -> str:
+    def _categorize_transaction(command: str, transaction_type: str,
+                                matcher: Optional[CategoryMatcher] = None) -> str:
         """Categorize transaction based on content"""
-        command_lower = command.lower()
-        
-        # Category keywords
-        categories = {
-            'product-sale': ['vegetables', 'fruits', 'food', 'products', 'items', 'goods'],
-            'service': ['service', 'repair', 'consultation', 'work'],
-            'supplies': ['supplies', 'materials', 'inventory', 'stock'],
-            'transport': ['transport', 'taxi', 'bus', 'fuel', 'petrol', 'gas'],
-            'food': ['food', 'lunch', 'dinner', 'snacks', 'tea', 'coffee'],
-            'utilities': ['electricity', 'water', 'phone', 'internet', 'rent']
-        }
-        
-        for category, keywords in categories.items():
-            if any(keyword in command_lower for keyword in keywords):
-                return category
-        
-        # Default categories
-        return 'product-sale' if transaction_type == 'sale' else 'supplies'
+        return (matcher or CategoryMatcher.default()).categorize(command, transaction_type)
 
 class BusinessCoach:
     """AI Business Coach for providing tips and insights"""
     
     @staticmethod
-    def get_personalized_tip(stats: BusinessStats, recent_transactions: List[Dict]) -> str:
+    def get_personalized_tip(stats: BusinessStats, recent_transactions: List[Dict],
+                             daily_target: float = 500.0) -> str:
         """Generate personalized business tip"""
         
         if stats.total_transactions == 0:
             return "Welcome! Start by recording your first sale or expense to begin tracking your business."
         
-        if stats.today_profit > 500:
+        if stats.today_profit > daily_target:
             return f"Excellent! You're ₹{stats.today_profit:.2f} in profit today. You're exceeding your daily target!"
         
         if stats.today_profit > 0:
@@ -423,6 +1255,555 @@ class BusinessCoach:
         import random
         return random.choice(tips)
 
+class AchievementsEngine:
+    """Evaluates milestone rules incrementally as transactions are committed"""
+    
+    MILESTONES = {
+        'first_sale': 'Recorded your first sale',
+        'daily_target': 'Hit your daily sales target',
+        'streak_3_days': 'Made sales 3 days in a row',
+        'streak_7_days': 'Made sales 7 days in a row',
+        'streak_30_days': 'Made sales 30 days in a row',
+        'sales_1000': 'Reached ₹1,000 in lifetime sales',
+        'sales_10000': 'Reached ₹10,000 in lifetime sales',
+        'sales_100000': 'Reached ₹100,000 in lifetime sales',
+        'transactions_100': 'Recorded 100 transactions',
+    }
+    STREAK_DAYS = (3, 7, 30)
+    SALES_THRESHOLDS = (1000, 10000, 100000)
+    TRANSACTION_THRESHOLDS = (100,)
+    
+    STATE_COLUMNS = ['total_sales', 'total_transactions', 'sale_day', 'day_sales',
+                     'last_sale_date', 'streak_days']
+    
+    @staticmethod
+    def empty_state() -> Dict:
+        """Progress for a user with no transactions"""
+        return {
+            'total_sales': 0.0,
+            'total_transactions': 0,
+            'sale_day': None,
+            'day_sales': 0.0,
+            'last_sale_date': None,
+            'streak_days': 0
+        }
+    
+    @staticmethod
+    def advance(state: Dict, transaction_type: str, amount: float, date: str) -> None:
+        """Fold one new transaction into the running progress"""
+        state['total_transactions'] += 1
+        if transaction_type != 'sale':
+            return
+        
+        state['total_sales'] += amount
+        
+        if state['sale_day'] == date:
+            state['day_sales'] += amount
+        elif state['sale_day'] is None or date > state['sale_day']:
+            state['sale_day'] = date
+            state['day_sales'] = amount
+        
+        # Back-dated sales don't extend or break the current streak
+        last = state['last_sale_date']
+        if last is None or date > last:
+            previous_day = (datetime.strptime(date, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+            state['streak_days'] = state['streak_days'] + 1 if last == previous_day else 1
+            state['last_sale_date'] = date
+    
+    @staticmethod
+    def reached(state: Dict, daily_target: float) -> List[str]:
+        """Milestone types satisfied by the current progress"""
+        reached = []
+        if state['total_sales'] > 0:
+            reached.append('first_sale')
+        if state['sale_day'] and state['day_sales'] >= daily_target:
+            reached.append('daily_target')
+        reached += [f'streak_{days}_days' for days in AchievementsEngine.STREAK_DAYS
+                    if state['streak_days'] >= days]
+        reached += [f'sales_{amount}' for amount in AchievementsEngine.SALES_THRESHOLDS
+                    if state['total_sales'] >= amount]
+        reached += [f'transactions_{count}' for count in AchievementsEngine.TRANSACTION_THRESHOLDS
+                    if state['total_transactions'] >= count]
+        return reached
+    
+    @staticmethod
+    def _daily_target(cursor, user_id: str) -> float:
+        cursor.execute('''
+            SELECT daily_target FROM business_profiles WHERE user_id = ?
+        ''', (user_id,))
+        row = cursor.fetchone()
+        return row[0] if row and row[0] is not None else 500.0
+    
+    @staticmethod
+    def load_state(cursor, user_id: str) -> Dict:
+        """Read a user's stored progress, or an empty one"""
+        cursor.execute(f'''
+            SELECT {', '.join(AchievementsEngine.STATE_COLUMNS)}
+            FROM achievement_progress WHERE user_id = ?
+        ''', (user_id,))
+        row = cursor.fetchone()
+        if row:
+            return dict(zip(AchievementsEngine.STATE_COLUMNS, row))
+        return AchievementsEngine.empty_state()
+    
+    @staticmethod
+    def _save_state(cursor, user_id: str, state: Dict) -> None:
+        columns = AchievementsEngine.STATE_COLUMNS
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO achievement_progress
+            (user_id, {', '.join(columns)}, updated_at)
+            VALUES (?, {', '.join('?' for _ in columns)}, ?)
+        ''', [user_id] + [state[column] for column in columns] + [datetime.now().isoformat()])
+    
+    @staticmethod
+    def _award(cursor, user_id: str, milestone_types: List[str], achieved_at: str) -> List[str]:
+        """Persist milestones, returning the ones that are new"""
+        awarded = []
+        for milestone_type in milestone_types:
+            cursor.execute('''
+                INSERT OR IGNORE INTO milestones (user_id, milestone_type, achieved_at)
+                VALUES (?, ?, ?)
+            ''', (user_id, milestone_type, achieved_at))
+            if cursor.rowcount > 0:
+                awarded.append(milestone_type)
+        return awarded
+    
+    @staticmethod
+    def record_transaction(cursor, transaction: Transaction) -> List[str]:
+        """Update progress for a new transaction inside the caller's DB transaction"""
+        state = AchievementsEngine.load_state(cursor, transaction.user_id)
+        AchievementsEngine.advance(state, transaction.type, transaction.amount, transaction.date)
+        AchievementsEngine._save_state(cursor, transaction.user_id, state)
+        
+        daily_target = AchievementsEngine._daily_target(cursor, transaction.user_id)
+        awarded = AchievementsEngine._award(
+            cursor, transaction.user_id,
+            AchievementsEngine.reached(state, daily_target),
+            transaction.timestamp or datetime.now().isoformat()
+        )
+        if awarded:
+            logger.info(f"Milestones achieved by {transaction.user_id}: {awarded}")
+        return awarded
+    
+    @staticmethod
+    def forget_transaction(cursor, user_id: str, transaction_type: str, amount: float, date: str) -> None:
+        """Take a deleted transaction out of the running totals (earned milestones and streaks stay)"""
+        state = AchievementsEngine.load_state(cursor, user_id)
+        state['total_transactions'] = max(state['total_transactions'] - 1, 0)
+        if transaction_type == 'sale':
+            state['total_sales'] = max(state['total_sales'] - amount, 0.0)
+            if state['sale_day'] == date:
+                state['day_sales'] = max(state['day_sales'] - amount, 0.0)
+        AchievementsEngine._save_state(cursor, user_id, state)
+    
+    @staticmethod
+    def daily_targets(cursor) -> Dict[str, float]:
+        """Daily sales target for every user with a business profile"""
+        cursor.execute('''
+            SELECT user_id, daily_target FROM business_profiles WHERE daily_target IS NOT NULL
+        ''')
+        return dict(cursor.fetchall())
+    
+    @staticmethod
+    def replay(rows, daily_targets: Dict[str, float]) -> Dict[str, tuple]:
+        """Replay (user_id, type, amount, date, timestamp) rows ordered by user and date,
+        returning user_id -> (progress state, {milestone_type: achieved_at})"""
+        results: Dict[str, tuple] = {}
+        for user_id, transaction_type, amount, date, timestamp in rows:
+            if user_id not in results:
+                results[user_id] = (AchievementsEngine.empty_state(), {})
+            state, achieved = results[user_id]
+            AchievementsEngine.advance(state, transaction_type, amount, date)
+            for milestone_type in AchievementsEngine.reached(state, daily_targets.get(user_id, 500.0)):
+                achieved.setdefault(milestone_type, timestamp)
+        return results
+    
+    @staticmethod
+    def save(cursor, results: Dict[str, tuple]) -> None:
+        """Persist replayed progress and award any milestones not yet recorded"""
+        for user_id, (state, achieved) in results.items():
+            AchievementsEngine._save_state(cursor, user_id, state)
+            for milestone_type, achieved_at in achieved.items():
+                AchievementsEngine._award(cursor, user_id, [milestone_type], achieved_at)
+    
+    @staticmethod
+    def rebuild(cursor, user_ids: Optional[List[str]] = None) -> int:
+        """Recompute progress and milestones by replaying the ledger, returning users processed"""
+        query = 'SELECT user_id, type, amount, date, timestamp FROM transactions'
+        params: List = []
+        if user_ids is not None:
+            query += f" WHERE user_id IN ({', '.join('?' for _ in user_ids)})"
+            params = list(user_ids)
+        cursor.execute(query + ' ORDER BY user_id, date, timestamp', params)
+        rows = cursor.fetchall()
+        
+        results = AchievementsEngine.replay(rows, AchievementsEngine.daily_targets(cursor))
+        AchievementsEngine.save(cursor, results)
+        return len(results)
+
+@dataclass
+class ForecastModel:
+    """Smoothed daily sales and expense state for one merchant"""
+    rollup_version: int = 0
+    fitted_through: Optional[str] = None
+    days_fitted: int = 0
+    sales_level: float = 0.0
+    expenses_level: float = 0.0
+    sales_season: List[float] = field(default_factory=lambda: [0.0] * 7)
+    expenses_season: List[float] = field(default_factory=lambda: [0.0] * 7)
+
+class SalesForecaster:
+    """Projects sales and profit with day-of-week seasonal exponential smoothing"""
+    
+    ALPHA = 0.3  # level smoothing
+    GAMMA = 0.2  # day-of-week smoothing
+    HISTORY_DAYS = 365
+    
+    _models: Dict[str, ForecastModel] = {}
+    _lock = threading.Lock()
+    
+    @staticmethod
+    def _smooth(level: float, season: List[float], weekday: int, value: float, first: bool) -> float:
+        """Fold one day into the level and its weekday's seasonal offset, returning the new level"""
+        if first:
+            return value
+        level = SalesForecaster.ALPHA * (value - season[weekday]) + (1 - SalesForecaster.ALPHA) * level
+        season[weekday] = SalesForecaster.GAMMA * (value - level) + (1 - SalesForecaster.GAMMA) * season[weekday]
+        return level
+    
+    @staticmethod
+    def _fit(cursor, user_id: str, model: ForecastModel, through: datetime) -> None:
+        """Fold completed days after model.fitted_through, up to and including through"""
+        through_str = through.strftime('%Y-%m-%d')
+        if model.fitted_through:
+            start = datetime.strptime(model.fitted_through, '%Y-%m-%d') + timedelta(days=1)
+        else:
+            start = through - timedelta(days=SalesForecaster.HISTORY_DAYS - 1)
+        
+        cursor.execute('''
+            SELECT date, sales, expenses FROM daily_rollups
+            WHERE user_id = ? AND date >= ? AND date <= ?
+            ORDER BY date
+        ''', (user_id, start.strftime('%Y-%m-%d'), through_str))
+        rollups = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        
+        # Leading days before a merchant's first transaction aren't zero-sales days
+        if model.days_fitted == 0:
+            if not rollups:
+                model.fitted_through = through_str
+                return
+            start = datetime.strptime(min(rollups), '%Y-%m-%d')
+        
+        day = start
+        while day <= through:
+            sales, expenses = rollups.get(day.strftime('%Y-%m-%d'), (0.0, 0.0))
+            first = model.days_fitted == 0
+            model.sales_level = SalesForecaster._smooth(
+                model.sales_level, model.sales_season, day.weekday(), sales, first)
+            model.expenses_level = SalesForecaster._smooth(
+                model.expenses_level, model.expenses_season, day.weekday(), expenses, first)
+            model.days_fitted += 1
+            day += timedelta(days=1)
+        
+        model.fitted_through = through_str
+    
+    @staticmethod
+    def _expected(model: ForecastModel, weekday: int) -> tuple:
+        """Expected (sales, expenses) for a full day on the given weekday"""
+        if model.days_fitted == 0:
+            return 0.0, 0.0
+        return (max(model.sales_level + model.sales_season[weekday], 0.0),
+                max(model.expenses_level + model.expenses_season[weekday], 0.0))
+    
+    @staticmethod
+    def _period(sales: float, expenses: float, projected_sales: float,
+                projected_expenses: float, target: float) -> Dict:
+        """Actual and projected figures for one period against its target"""
+        return {
+            'sales_so_far': round(sales, 2),
+            'expenses_so_far': round(expenses, 2),
+            'profit_so_far': round(sales - expenses, 2),
+            'projected_sales': round(projected_sales, 2),
+            'projected_expenses': round(projected_expenses, 2),
+            'projected_profit': round(projected_sales - projected_expenses, 2),
+            'target': target,
+            'projected_target_progress': round(projected_sales / target * 100, 1) if target else None,
+            'on_track': projected_sales >= target if target else None
+        }
+    
+    @staticmethod
+    def forecast(cursor, user_id: str, now: datetime) -> Dict:
+        """Project end-of-day and end-of-week results from the cached model"""
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        yesterday = today - timedelta(days=1)
+        
+        # The version lives in the database so a rollup change made by any
+        # process (another worker, the batch job) invalidates this cache
+        cursor.execute('SELECT version FROM daily_rollup_versions WHERE user_id = ?', (user_id,))
+        row = cursor.fetchone()
+        version = row[0] if row else 0
+        
+        with SalesForecaster._lock:
+            model = SalesForecaster._models.get(user_id)
+        
+        # Fit a private copy outside the lock, so one merchant's refit never
+        # blocks forecasts for the others, then swap it in
+        if model is None or model.rollup_version != version:
+            model = ForecastModel(rollup_version=version)
+        if model.fitted_through != yesterday.strftime('%Y-%m-%d'):
+            model = replace(model, sales_season=list(model.sales_season),
+                            expenses_season=list(model.expenses_season))
+            SalesForecaster._fit(cursor, user_id, model, yesterday)
+            with SalesForecaster._lock:
+                SalesForecaster._models[user_id] = model
+        
+        week_start = today - timedelta(days=today.weekday())
+        cursor.execute('''
+            SELECT date, sales, expenses FROM daily_rollups
+            WHERE user_id = ? AND date >= ? AND date <= ?
+        ''', (user_id, week_start.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')))
+        week = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        today_sales, today_expenses = week.get(today.strftime('%Y-%m-%d'), (0.0, 0.0))
+        week_sales = sum((sales for sales, _ in week.values()), 0.0)
+        week_expenses = sum((expenses for _, expenses in week.values()), 0.0)
+        
+        cursor.execute('''
+            SELECT daily_target, weekly_target FROM business_profiles WHERE user_id = ?
+        ''', (user_id,))
+        row = cursor.fetchone()
+        daily_target = row[0] if row and row[0] is not None else 500.0
+        weekly_target = row[1] if row and row[1] is not None else 3500.0
+        
+        # Expect the rest of today's usual takings in proportion to the time left
+        remaining = 1 - (now - today).total_seconds() / 86400
+        expected_sales, expected_expenses = SalesForecaster._expected(model, today.weekday())
+        rest_of_today = (expected_sales * remaining, expected_expenses * remaining)
+        
+        rest_of_week = [0.0, 0.0]
+        for offset in range(1, 7 - today.weekday()):
+            sales, expenses = SalesForecaster._expected(model, (today.weekday() + offset) % 7)
+            rest_of_week[0] += sales
+            rest_of_week[1] += expenses
+        
+        return {
+            'date': today.strftime('%Y-%m-%d'),
+            'today': SalesForecaster._period(
+                today_sales, today_expenses,
+                today_sales + rest_of_today[0], today_expenses + rest_of_today[1],
+                daily_target),
+            'week': dict(
+                week_start=week_start.strftime('%Y-%m-%d'),
+                week_end=(week_start + timedelta(days=6)).strftime('%Y-%m-%d'),
+                **SalesForecaster._period(
+                    week_sales, week_expenses,
+                    week_sales + rest_of_today[0] + rest_of_week[0],
+                    week_expenses + rest_of_today[1] + rest_of_week[1],
+                    weekly_target)),
+            'model': {
+                'days_fitted': model.days_fitted,
+                'fitted_through': model.fitted_through
+            }
+        }
+
+class PayloadEncoder:
+    """Compact encodings for list-heavy API payloads"""
+    
+    FORMATS = ('json', 'columnar', 'msgpack')
+    
+    @staticmethod
+    def negotiate_format(requested: Optional[str], accept: MIMEAccept) -> str:
+        """Pick a format from ?format= or the parsed Accept header, defaulting to json"""
+        if requested not in PayloadEncoder.FORMATS:
+            # best_match honours q-values, so "application/msgpack;q=0" opts out
+            mimetype = accept.best_match(
+                ['application/json', COLUMNAR_MIMETYPE, MSGPACK_MIMETYPE, 'application/x-msgpack'],
+                default='application/json'
+            )
+            requested = {COLUMNAR_MIMETYPE: 'columnar', MSGPACK_MIMETYPE: 'msgpack',
+                         'application/x-msgpack': 'msgpack'}.get(mimetype, 'json')
+        
+        # Without the msgpack package the columnar JSON is the next most compact
+        if requested == 'msgpack' and msgpack is None:
+            return 'columnar'
+        return requested
+    
+    @staticmethod
+    def to_columnar(rows: List[Dict], columns: tuple) -> Dict[str, List]:
+        """Turn a list of row dicts into parallel arrays keyed by column"""
+        # Columns are passed in so an empty page still carries them
+        return {column: [row[column] for row in rows] for column in columns}
+    
+    @staticmethod
+    def columnarize(payload: Dict, tables: List[tuple]) -> Dict:
+        """Copy payload with the row lists at the given (key path, columns) made columnar"""
+        payload = dict(payload)
+        for path, columns in tables:
+            parent = payload
+            for key in path[:-1]:
+                parent[key] = dict(parent[key])
+                parent = parent[key]
+            parent[path[-1]] = PayloadEncoder.to_columnar(parent[path[-1]], columns)
+        return payload
+    
+    @staticmethod
+    def encode(payload: Dict, fmt: str, tables: List[tuple]) -> tuple:
+        """Serialize a compact payload, returning (body, mimetype)"""
+        compact = PayloadEncoder.columnarize(payload, tables)
+        if fmt == 'msgpack':
+            return msgpack.packb(compact, use_bin_type=True), MSGPACK_MIMETYPE
+        return json.dumps(compact, separators=(',', ':')).encode('utf-8'), COLUMNAR_MIMETYPE
+
+def _partition_fingerprint(cursor, user_ids: List[str]) -> tuple:
+    """Row count and highest id of a partition's transactions; changes on any insert or delete"""
+    cursor.execute(f'''
+        SELECT COUNT(*), COALESCE(MAX(id), 0) FROM transactions
+        WHERE user_id IN ({', '.join('?' for _ in user_ids)})
+    ''', user_ids)
+    return tuple(cursor.fetchone())
+
+def _recompute_partition(db_path: str, user_ids: List[str], recategorize: bool, today: str,
+                         include_legacy: bool = False) -> Dict:
+    """Worker: recategorize and re-aggregate one partition of merchants from a read-only connection"""
+    uri = Path(db_path).resolve().as_uri() + '?mode=ro'
+    with sqlite3.connect(uri, uri=True) as conn:
+        cursor = conn.cursor()
+        # One read transaction, so the fingerprint describes exactly the rows read
+        cursor.execute('BEGIN')
+        fingerprint = _partition_fingerprint(cursor, user_ids)
+        cursor.execute(f'''
+            SELECT id, user_id, type, amount, description, category, date, timestamp,
+                   {DatabaseManager.recategorizable_condition(include_legacy)},
+                   COALESCE(source_text, description)
+            FROM transactions
+            WHERE user_id IN ({', '.join('?' for _ in user_ids)})
+            ORDER BY user_id, date, timestamp
+        ''', user_ids)
+        rows = cursor.fetchall()
+        daily_targets = AchievementsEngine.daily_targets(cursor)
+        
+        cursor.execute(f'''
+            SELECT user_id, business_type FROM business_profiles
+            WHERE user_id IN ({', '.join('?' for _ in user_ids)})
+        ''', user_ids)
+        business_types = {user_id: CategoryMatcher.normalize_business_type(business_type)
+                          for user_id, business_type in cursor.fetchall()}
+        matchers = {business_type: CategoryMatcher.load(cursor, business_type)
+                    for business_type in set(business_types.values()) | {''}}
+    
+    category_changes = []
+    rollups: Dict[tuple, List] = {}
+    totals: Dict[str, Dict] = {}
+    ledgers: Dict[str, List[Dict]] = {}
+    for (transaction_id, user_id, transaction_type, amount, description, category, date, timestamp,
+         recategorizable, source_text) in rows:
+        # Categories the client supplied are never overwritten
+        if recategorize and recategorizable:
+            matcher = matchers[business_types.get(user_id, '')]
+            new_category = VoiceProcessor._categorize_transaction(source_text, transaction_type, matcher)
+            if new_category != category:
+                category_changes.append((new_category, transaction_id, category))
+                category = new_category
+        
+        rollup = rollups.setdefault((user_id, date), [0.0, 0.0, 0])
+        user_totals = totals.setdefault(user_id, {'sale': 0.0, 'expense': 0.0, 'today': 0.0, 'categories': {}})
+        sign = 1 if transaction_type == 'sale' else -1
+        rollup[0 if transaction_type == 'sale' else 1] += amount
+        rollup[2] += 1
+        user_totals[transaction_type] = user_totals.get(transaction_type, 0.0) + amount
+        if date == today:
+            user_totals['today'] += sign * amount
+        if transaction_type == 'sale':
+            user_totals['categories'][category] = user_totals['categories'].get(category, 0.0) + amount
+        ledgers.setdefault(user_id, []).append({
+            'id': transaction_id, 'type': transaction_type, 'amount': amount,
+            'description': description, 'category': category, 'timestamp': timestamp, 'date': date
+        })
+    
+    achievements = AchievementsEngine.replay(
+        [(row[1], row[2], row[3], row[6], row[7]) for row in rows], daily_targets
+    )
+    
+    reports = {}
+    for user_id, user_totals in totals.items():
+        stats = BusinessStats(
+            today_profit=user_totals['today'],
+            total_sales=user_totals['sale'],
+            total_expenses=user_totals['expense'],
+            net_profit=user_totals['sale'] - user_totals['expense'],
+            total_transactions=len(ledgers[user_id])
+        )
+        recent = sorted(ledgers[user_id], key=lambda t: t['timestamp'], reverse=True)[:10]
+        reports[user_id] = {
+            'stats': asdict(stats),
+            'category_breakdown': [
+                {'category': category, 'amount': amount}
+                for category, amount in sorted(user_totals['categories'].items(), key=lambda c: -c[1])
+            ],
+            'tip': BusinessCoach.get_personalized_tip(stats, recent, daily_targets.get(user_id, 500.0)),
+            'milestones': sorted(achievements[user_id][1])
+        }
+    
+    return {
+        'user_ids': user_ids,
+        'fingerprint': fingerprint,
+        'rows': len(rows),
+        'category_changes': category_changes,
+        'rollups': [(user_id, date) + tuple(values) for (user_id, date), values in rollups.items()],
+        'achievements': achievements,
+        'reports': reports
+    }
+
+def recompute_all_merchants(db_path: str, workers: Optional[int] = None, partition_size: int = 50,
+                            recategorize: bool = False, progress=None,
+                            include_legacy: bool = False) -> Dict:
+    """Recompute every merchant's categories, rollups, milestones and reports across a process pool"""
+    writer = DatabaseManager(db_path)
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT DISTINCT user_id FROM transactions ORDER BY user_id')
+        user_ids = [row[0] for row in cursor.fetchall()]
+    
+    partitions = [user_ids[i:i + partition_size] for i in range(0, len(user_ids), partition_size)]
+    today = datetime.now().strftime('%Y-%m-%d')
+    summary = {'merchants': 0, 'transactions': 0, 'recategorized': 0, 'retried': 0, 'skipped': 0,
+               'partitions': len(partitions), 'workers': workers or os.cpu_count()}
+    
+    started = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_recompute_partition, db_path, partition, recategorize, today,
+                               include_legacy): (partition, 1)
+                   for partition in partitions}
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                partition, attempt = pending.pop(future)
+                result = future.result()
+                
+                # A partition whose ledger moved since the worker read it is redone
+                recategorized = writer.write_recompute_results(result)
+                if recategorized is None:
+                    if attempt < RECOMPUTE_MAX_ATTEMPTS:
+                        summary['retried'] += 1
+                        pending[pool.submit(_recompute_partition, db_path, partition,
+                                            recategorize, today, include_legacy)] = (partition, attempt + 1)
+                        continue
+                    logger.warning(f"Skipped recompute of {len(partition)} merchants: "
+                                   f"ledger kept changing after {attempt} attempts")
+                    summary['skipped'] += len(partition)
+                else:
+                    summary['merchants'] += len(result['user_ids'])
+                    summary['transactions'] += result['rows']
+                    summary['recategorized'] += recategorized
+                
+                done += 1
+                if progress:
+                    progress(done, len(partitions), summary, time.perf_counter() - started)
+    
+    summary['seconds'] = time.perf_counter() - started
+    summary['transactions_per_second'] = summary['transactions'] / summary['seconds'] if summary['seconds'] else 0.0
+    return summary
+
 # Initialize database
 db_manager = DatabaseManager(DATABASE_PATH)
 
@@ -442,6 +1823,73 @@ def script():
     """Serve JavaScript file"""
     return send_from_directory('.', 'scripts.js')
 
+def _encoded_response(payload: Dict, tables: List[tuple]):
+    """Respond in the negotiated format, gzipped when the client accepts it"""
+    fmt = PayloadEncoder.negotiate_format(request.args.get('format'), request.accept_mimetypes)
+    if fmt == 'json':
+        response = jsonify(payload)
+    else:
+        body, mimetype = PayloadEncoder.encode(payload, fmt, tables)
+        response = Response(body, mimetype=mimetype)
+    
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    # Honours q-values, so "gzip;q=0" opts out
+    if request.accept_encodings['gzip'] > 0:
+        body = response.get_data()
+        if len(body) >= GZIP_MIN_BYTES:
+            response.set_data(gzip.compress(body, compresslevel=6))
+            response.headers['Content-Encoding'] = 'gzip'
+    
+    return response
+
+def _request_hash() -> str:
+    """Fingerprint of the JSON request body, independent of key order and spacing"""
+    body = json.dumps(request.get_json(silent=True), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+def _replay_idempotent_request(user_id: str, endpoint: str, build_response):
+    """Return the original response for a retried write, or None for a new request"""
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        return None
+    
+    if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        return jsonify({
+            'success': False,
+            'error': f'Idempotency-Key must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters'
+        }), 400
+    
+    record = db_manager.get_idempotent_transaction(user_id, key)
+    if not record:
+        return None
+    
+    if record['endpoint'] != endpoint or record['request_hash'] != _request_hash():
+        return jsonify({
+            'success': False,
+            'error': 'Idempotency-Key was already used for a different request'
+        }), 422
+    
+    logger.info(f"Replaying idempotent request for transaction {record['transaction']['id']}")
+    response = build_response(record['transaction'])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def _add_transaction_response(transaction: Dict):
+    """Response body for POST /api/transactions"""
+    return jsonify({
+        'success': True,
+        'transaction_id': transaction['id'],
+        'message': 'Transaction added successfully'
+    })
+
+def _voice_command_response(transaction: Dict):
+    """Response body for POST /api/voice-command"""
+    return jsonify({
+        'success': True,
+        'transaction': transaction,
+        'message': 'Transaction extracted and added successfully'
+    })
+
 @app.route('/api/transactions', methods=['GET'])
 def get_transactions():
     """Get user transactions"""
@@ -450,10 +1898,10 @@ def get_transactions():
     
     try:
         transactions = db_manager.get_transactions(user_id, limit)
-        return jsonify({
+        return _encoded_response({
             'success': True,
             'transactions': transactions
-        })
+        }, [(('transactions',), TRANSACTION_COLUMNS)])
     except Exception as e:
         logger.error(f"Error fetching transactions: {e}")
         return jsonify({
@@ -461,11 +1909,68 @@ def get_transactions():
             'error': 'Failed to fetch transactions'
         }), 500
 
+@app.route('/api/transactions/search', methods=['GET'])
+def search_transactions():
+    """Search transactions by description and category"""
+    user_id = request.args.get('user_id', 'demo_user')
+    query = request.args.get('q', '').strip()
+    transaction_type = request.args.get('type')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    
+    try:
+        limit = max(min(int(request.args.get('limit', 20)), 100), 1)
+        offset = max(int(request.args.get('offset', 0)), 0)
+        for value in (start_date, end_date):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid limit, offset or date (expected YYYY-MM-DD)'
+        }), 400
+    
+    if not query:
+        return jsonify({
+            'success': False,
+            'error': 'No search query provided'
+        }), 400
+    
+    if transaction_type and transaction_type not in ('sale', 'expense'):
+        return jsonify({
+            'success': False,
+            'error': "Type must be 'sale' or 'expense'"
+        }), 400
+    
+    try:
+        results = db_manager.search_transactions(
+            user_id, query, transaction_type, start_date, end_date, limit, offset
+        )
+        return jsonify({
+            'success': True,
+            'transactions': results['transactions'],
+            'total': results['total'],
+            'limit': limit,
+            'offset': offset,
+            'has_more': offset + len(results['transactions']) < results['total']
+        })
+    except Exception as e:
+        logger.error(f"Error searching transactions: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to search transactions'
+        }), 500
+
 @app.route('/api/transactions', methods=['POST'])
 def add_transaction():
     """Add new transaction"""
     try:
         data = request.get_json()
+        user_id = data.get('user_id', 'demo_user')
+        
+        replay = _replay_idempotent_request(user_id, request.path, _add_transaction_response)
+        if replay:
+            return replay
         
         # Validate required fields
         required_fields = ['type', 'amount', 'description', 'category']
@@ -478,7 +1983,7 @@ def add_transaction():
         
         # Create transaction
         transaction = Transaction(
-            user_id=data.get('user_id', 'demo_user'),
+            user_id=user_id,
             type=data['type'],
             amount=float(data['amount']),
             description=data['description'],
@@ -488,13 +1993,19 @@ def add_transaction():
         )
         
         # Add to database
-        transaction_id = db_manager.add_transaction(transaction)
+        try:
+            transaction.id = db_manager.add_transaction(
+                transaction, request.headers.get('Idempotency-Key'), request.path, _request_hash()
+            )
+        except sqlite3.IntegrityError:
+            # A concurrent retry with the same key won the race; any other
+            # constraint failure (or no key at all) is a genuine error
+            replay = _replay_idempotent_request(user_id, request.path, _add_transaction_response)
+            if replay:
+                return replay
+            raise
         
-        return jsonify({
-            'success': True,
-            'transaction_id': transaction_id,
-            'message': 'Transaction added successfully'
-        })
+        return _add_transaction_response(asdict(transaction))
         
     except Exception as e:
         logger.error(f"Error adding transaction: {e}")
@@ -535,6 +2046,11 @@ def process_voice_command():
     try:
         data = request.get_json()
         command = data.get('command', '')
+        user_id = data.get('user_id', 'demo_user')
+        
+        replay = _replay_idempotent_request(user_id, request.path, _voice_command_response)
+        if replay:
+            return replay
         
         if not command:
             return jsonify({
@@ -543,7 +2059,8 @@ def process_voice_command():
             }), 400
         
         # Process voice command
-        transaction = VoiceProcessor.process_voice_command(command)
+        matcher = db_manager.get_category_matcher(user_id)
+        transaction = VoiceProcessor.process_voice_command(command, matcher)
         
         if not transaction:
             return jsonify({
@@ -557,17 +2074,23 @@ def process_voice_command():
             })
         
         # Set user ID
-        transaction.user_id = data.get('user_id', 'demo_user')
+        transaction.user_id = user_id
         
         # Add to database
-        transaction_id = db_manager.add_transaction(transaction)
-        transaction.id = transaction_id
+        try:
+            transaction.id = db_manager.add_transaction(
+                transaction, request.headers.get('Idempotency-Key'), request.path, _request_hash(),
+                category_source='rules', source_text=command
+            )
+        except sqlite3.IntegrityError:
+            # A concurrent retry with the same key won the race; any other
+            # constraint failure (or no key at all) is a genuine error
+            replay = _replay_idempotent_request(user_id, request.path, _voice_command_response)
+            if replay:
+                return replay
+            raise
         
-        return jsonify({
-            'success': True,
-            'transaction': asdict(transaction),
-            'message': 'Transaction extracted and added successfully'
-        })
+        return _voice_command_response(asdict(transaction))
         
     except Exception as e:
         logger.error(f"Error processing voice command: {e}")
@@ -602,7 +2125,10 @@ def get_coach_tip():
     try:
         stats = db_manager.get_business_stats(user_id)
         recent_transactions = db_manager.get_transactions(user_id, 10)
-        tip = BusinessCoach.get_personalized_tip(stats, recent_transactions)
+        profile = db_manager.get_business_profile(user_id) or {}
+        tip = BusinessCoach.get_personalized_tip(
+            stats, recent_transactions, profile.get('daily_target') or 500.0
+        )
         
         return jsonify({
             'success': True,
@@ -616,6 +2142,192 @@ def get_coach_tip():
             'error': 'Failed to generate tip'
         }), 500
 
+@app.route('/api/report', methods=['GET'])
+def get_merchant_report():
+    """Get the merchant report produced by the last batch recompute"""
+    user_id = request.args.get('user_id', 'demo_user')
+    
+    try:
+        report = db_manager.get_merchant_report(user_id)
+        if not report:
+            return jsonify({
+                'success': False,
+                'error': 'No report generated yet'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'report': report
+        })
+    except Exception as e:
+        logger.error(f"Error fetching merchant report: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to fetch report'
+        }), 500
+
+@app.route('/api/forecast', methods=['GET'])
+def get_forecast():
+    """Get end-of-day and end-of-week projections against targets"""
+    user_id = request.args.get('user_id', 'demo_user')
+    
+    try:
+        forecast = db_manager.get_forecast(user_id)
+        return jsonify({
+            'success': True,
+            'forecast': forecast
+        })
+    except Exception as e:
+        logger.error(f"Error fetching forecast: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to fetch forecast'
+        }), 500
+
+@app.route('/api/category-rules', methods=['GET'])
+def get_category_rules():
+    """Get category rules for a business type (defaults when omitted)"""
+    business_type = request.args.get('business_type', '')
+    
+    try:
+        rules = db_manager.get_category_rules(business_type)
+        return jsonify({
+            'success': True,
+            **rules
+        })
+    except Exception as e:
+        logger.error(f"Error fetching category rules: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to fetch category rules'
+        }), 500
+
+@app.route('/api/category-rules', methods=['POST'])
+def update_category_rules():
+    """Replace the category rules for a business type"""
+    try:
+        data = request.get_json()
+        rules = data.get('rules')
+        
+        if not isinstance(rules, list):
+            return jsonify({
+                'success': False,
+                'error': 'Missing required field: rules'
+            }), 400
+        
+        if not isinstance(data.get('business_type', ''), str):
+            return jsonify({
+                'success': False,
+                'error': 'business_type must be a string'
+            }), 400
+        
+        for rule in rules:
+            if not isinstance(rule, dict):
+                return jsonify({
+                    'success': False,
+                    'error': 'Each rule must be an object'
+                }), 400
+            if not all(isinstance(rule.get(name), str) and rule[name].strip()
+                       for name in ('keyword', 'category')):
+                return jsonify({
+                    'success': False,
+                    'error': 'Each rule needs a keyword and a category'
+                }), 400
+            if rule.get('transaction_type', 'any') not in ('sale', 'expense', 'any'):
+                return jsonify({
+                    'success': False,
+                    'error': "transaction_type must be 'sale', 'expense' or 'any'"
+                }), 400
+            priority = rule.get('priority', 0)
+            # bool is an int subclass, but true/false is never a meaningful priority
+            if not isinstance(priority, int) or isinstance(priority, bool):
+                return jsonify({
+                    'success': False,
+                    'error': 'priority must be an integer'
+                }), 400
+        
+        version = db_manager.replace_category_rules(data.get('business_type', ''), rules)
+        
+        return jsonify({
+            'success': True,
+            'version': version,
+            'message': 'Category rules updated successfully'
+        })
+        
+    except Exception as e:
+        logger.error(f"Error updating category rules: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to update category rules'
+        }), 500
+
+@app.route('/api/recategorize', methods=['POST'])
+def recategorize_transactions():
+    """Re-apply the current category rules to past transactions"""
+    try:
+        data = request.get_json() or {}
+        user_id = data.get('user_id', 'demo_user')
+        since = data.get('since')
+        include_legacy = data.get('include_legacy', False)
+        
+        if since:
+            try:
+                if not isinstance(since, str):
+                    raise ValueError(since)
+                datetime.strptime(since, '%Y-%m-%d')
+            except ValueError:
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid since date (expected YYYY-MM-DD)'
+                }), 400
+        
+        if not isinstance(include_legacy, bool):
+            return jsonify({
+                'success': False,
+                'error': 'include_legacy must be true or false'
+            }), 400
+        
+        result = db_manager.recategorize_transactions(user_id, since, include_legacy)
+        
+        return jsonify({
+            'success': True,
+            'scanned': result['scanned'],
+            'updated': result['updated'],
+            'message': 'Transactions recategorized successfully'
+        })
+        
+    except Exception as e:
+        logger.error(f"Error recategorizing transactions: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to recategorize transactions'
+        }), 500
+
+@app.route('/api/milestones', methods=['GET'])
+def get_milestones():
+    """Get achieved milestones and progress towards the rest"""
+    user_id = request.args.get('user_id', 'demo_user')
+    
+    try:
+        result = db_manager.get_milestones(user_id)
+        achieved = {milestone['milestone_type'] for milestone in result['milestones']}
+        return jsonify({
+            'success': True,
+            'milestones': result['milestones'],
+            'upcoming': [
+                {'milestone_type': milestone_type, 'description': description}
+                for milestone_type, description in AchievementsEngine.MILESTONES.items()
+                if milestone_type not in achieved
+            ],
+            'progress': result['progress']
+        })
+    except Exception as e:
+        logger.error(f"Error fetching milestones: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to fetch milestones'
+        }), 500
+
 @app.route('/api/profile', methods=['GET'])
 def get_business_profile():
     """Get business profile"""
@@ -704,13 +2416,16 @@ def get_analytics():
             
             category_data = [{'category': row[0], 'amount': row[1]} for row in cursor.fetchall()]
             
-            return jsonify({
+            return _encoded_response({
                 'success': True,
                 'analytics': {
                     'daily_data': daily_data,
                     'category_breakdown': category_data
                 }
-            })
+            }, [
+                (('analytics', 'daily_data'), ('date', 'sales', 'expenses', 'profit')),
+                (('analytics', 'category_breakdown'), ('category', 'amount'))
+            ])
             
     except Exception as e:
         logger.error(f"Error fetching analytics: {e}")
@@ -741,6 +2456,29 @@ def internal_error(error):
     }), 500
 
 
+@app.cli.command('recompute-analytics')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+@click.option('--partition-size', type=int, default=50, show_default=True,
+              help='Merchants per worker task')
+@click.option('--recategorize/--no-recategorize', default=False, show_default=True,
+              help='Re-apply category rules to historical rule-categorized transactions')
+@click.option('--include-legacy', is_flag=True,
+              help='With --recategorize, also rewrite rows recorded before category sources were tracked')
+def recompute_analytics_command(workers, partition_size, recategorize, include_legacy):
+    """Recompute every merchant's aggregates, milestones and reports in parallel"""
+    def progress(done, total, summary, elapsed):
+        click.echo(f"[{done}/{total}] {summary['merchants']} merchants, "
+                   f"{summary['transactions']} transactions, "
+                   f"{summary['transactions'] / elapsed:.0f} transactions/s")
+    
+    summary = recompute_all_merchants(DATABASE_PATH, workers, partition_size, recategorize, progress,
+                                      include_legacy)
+    click.echo(f"Recomputed {summary['merchants']} merchants ({summary['transactions']} transactions, "
+               f"{summary['recategorized']} recategorized) with {summary['workers']} workers "
+               f"in {summary['seconds']:.2f}s")
+    if summary['skipped']:
+        click.echo(f"Skipped {summary['skipped']} merchants whose ledgers kept changing; rerun to pick them up")
+
 @app.route('/routes')
 def list_routes():
     routes = []
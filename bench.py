@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+TradeJoy - Performance benchmarks
+Runs against a throwaway database filled with a synthetic ledger.
+
+Usage: python bench.py {search,idempotency,encoding,batch} [options]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Point the app at a scratch database before it is imported
+_BENCH_DIR = tempfile.mkdtemp(prefix='tradejoy-bench-')
+os.environ.setdefault('TRADEJOY_DB', os.path.join(_BENCH_DIR, 'bench.db'))
+
+from app import (DatabaseManager, PayloadEncoder, Transaction, DATABASE_PATH,  # noqa: E402
+                 TRANSACTION_COLUMNS, msgpack, recompute_all_merchants)
+
+ITEMS = ['tomatoes', 'onions', 'potatoes', 'mangoes', 'bananas', 'rice', 'flour',
+         'sugar', 'tea', 'coffee', 'soap', 'phone repair', 'tailoring', 'bus fare',
+         'petrol', 'electricity', 'rent', 'stock', 'snacks', 'vegetables']
+CATEGORIES = ['product-sale', 'service', 'supplies', 'transport', 'food', 'utilities']
+
+
+def build_ledger(db_path: str, rows: int, users: int = 200) -> None:
+    """Bulk-load a synthetic ledger spread over the last year"""
+    rng = random.Random(42)
+    start = datetime.now() - timedelta(days=365)
+    batch = []
+    for _ in range(rows):
+        when = start + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        item = rng.choice(ITEMS)
+        kind = rng.choice(['sale', 'sale', 'expense'])
+        batch.append((
+            f'user_{rng.randrange(users)}',
+            kind,
+            round(rng.uniform(10, 1000), 2),
+            f"{'Sold' if kind == 'sale' else 'Bought'} {item}".title(),
+            rng.choice(CATEGORIES),
+            when.isoformat(),
+            when.strftime('%Y-%m-%d'),
+        ))
+
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany('''
+            INSERT INTO transactions (user_id, type, amount, description, category, timestamp, date)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', batch)
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, user_id, description, category FROM transactions')
+        DatabaseManager._index_search_terms(cursor, cursor.fetchall())
+        conn.commit()
+
+
+def report(label: str, samples: list) -> None:
+    """Print latency percentiles in milliseconds"""
+    samples = sorted(s * 1000 for s in samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<36} median {statistics.median(samples):7.3f} ms   p95 {p95:7.3f} ms")
+
+
+def bench_search(args) -> None:
+    """Search latency on a large ledger: FTS5 index vs LIKE scan"""
+    db = DatabaseManager(DATABASE_PATH)
+    print(f"Building ledger of {args.rows} rows across {args.users} users...")
+    build_ledger(DATABASE_PATH, args.rows, args.users)
+
+    month_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    cases = [
+        ('prefix "tom"', dict(query='tom')),
+        ('two terms "sold mango"', dict(query='sold mango')),
+        ('category "transport"', dict(query='transport')),
+        ('"tomatoes" sales, last month', dict(query='tomatoes', transaction_type='sale',
+                                              start_date=month_ago)),
+    ]
+
+    for fts_enabled in (True, False):
+        db.fts_enabled = fts_enabled
+        print(f"\n{'FTS5 index' if fts_enabled else 'LIKE scan (fallback)'}")
+        for label, kwargs in cases:
+            samples = []
+            for i in range(args.iterations):
+                started = time.perf_counter()
+                db.search_transactions(f'user_{i % args.users}', **kwargs)
+                samples.append(time.perf_counter() - started)
+            report(label, samples)
+
+
+def bench_idempotency(args) -> None:
+    """Write-path latency with and without an Idempotency-Key, plus replay lookups"""
+    db = DatabaseManager(DATABASE_PATH)
+    print(f"Building ledger of {args.rows} rows...")
+    build_ledger(DATABASE_PATH, args.rows)
+
+    def new_transaction(i: int) -> Transaction:
+        now = datetime.now()
+        return Transaction(user_id=f'user_{i % 200}', type='sale', amount=50.0,
+                           description='Sold Tomatoes', category='product-sale',
+                           timestamp=now.isoformat(), date=now.strftime('%Y-%m-%d'))
+
+    plain, keyed, replays = [], [], []
+    for i in range(args.iterations):
+        started = time.perf_counter()
+        db.add_transaction(new_transaction(i))
+        plain.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        db.add_transaction(new_transaction(i), f'key-{i}', '/api/transactions', f'hash-{i}')
+        keyed.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        db.get_idempotent_transaction(f'user_{i % 200}', f'key-{i}')
+        replays.append(time.perf_counter() - started)
+
+    print()
+    report('add_transaction, no key', plain)
+    report('add_transaction, with key', keyed)
+    report('replay lookup', replays)
+
+
+def bench_encoding(args) -> None:
+    """Payload size and serialization time for each response format"""
+    db = DatabaseManager(DATABASE_PATH)
+    build_ledger(DATABASE_PATH, args.rows, users=1)
+    payload = {'success': True, 'transactions': db.get_transactions('user_0', args.rows)}
+    tables = [(('transactions',), TRANSACTION_COLUMNS)]
+
+    encoders = [
+        # Mirrors jsonify's compact output
+        ('json (default)', lambda: json.dumps(payload, separators=(',', ':')).encode('utf-8')),
+        ('columnar json', lambda: PayloadEncoder.encode(payload, 'columnar', tables)[0]),
+    ]
+    if msgpack is not None:
+        encoders.append(('msgpack', lambda: PayloadEncoder.encode(payload, 'msgpack', tables)[0]))
+    else:
+        print("msgpack not installed, skipping")
+
+    print(f"\n{len(payload['transactions'])} transactions")
+    print(f"{'format':<20}{'bytes':>10}{'gzip bytes':>12}{'encode ms':>12}{'+gzip ms':>11}")
+    for label, encode in encoders:
+        timings, gzip_timings = [], []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            body = encode()
+            timings.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            compressed = gzip.compress(body, compresslevel=6)
+            gzip_timings.append(time.perf_counter() - started)
+        print(f"{label:<20}{len(body):>10}{len(compressed):>12}"
+              f"{statistics.median(timings) * 1000:>12.3f}{statistics.median(gzip_timings) * 1000:>11.3f}")
+
+
+def bench_batch(args) -> None:
+    """Throughput of the recompute-analytics batch job across worker counts"""
+    DatabaseManager(DATABASE_PATH)
+    print(f"Building ledger of {args.rows} rows across {args.users} users...")
+    build_ledger(DATABASE_PATH, args.rows, args.users)
+
+    # Warm the page cache so the first timed pass isn't penalised
+    recompute_all_merchants(DATABASE_PATH, 1, args.partition_size, args.recategorize)
+
+    workers = args.workers or sorted({1, 2, 4, os.cpu_count() or 1})
+    print(f"\n{'workers':>8}{'seconds':>10}{'rows/s':>12}{'speedup':>10}")
+    baseline = None
+    for count in workers:
+        summary = recompute_all_merchants(DATABASE_PATH, count, args.partition_size, args.recategorize)
+        baseline = baseline or summary['seconds']
+        print(f"{count:>8}{summary['seconds']:>10.2f}{summary['transactions_per_second']:>12.0f}"
+              f"{baseline / summary['seconds']:>9.2f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='TradeJoy benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    search = subparsers.add_parser('search', help='transaction search latency')
+    search.add_argument('--rows', type=int, default=200_000)
+    search.add_argument('--users', type=int, default=200)
+    search.add_argument('--iterations', type=int, default=200)
+    search.set_defaults(func=bench_search)
+
+    idempotency = subparsers.add_parser('idempotency', help='idempotent write overhead')
+    idempotency.add_argument('--rows', type=int, default=200_000)
+    idempotency.add_argument('--iterations', type=int, default=500)
+    idempotency.set_defaults(func=bench_idempotency)
+
+    encoding = subparsers.add_parser('encoding', help='response payload size and encode time')
+    encoding.add_argument('--rows', type=int, default=500)
+    encoding.add_argument('--iterations', type=int, default=50)
+    encoding.set_defaults(func=bench_encoding)
+
+    batch = subparsers.add_parser('batch', help='batch recompute scaling across core counts')
+    batch.add_argument('--rows', type=int, default=200_000)
+    batch.add_argument('--users', type=int, default=1000)
+    batch.add_argument('--partition-size', type=int, default=50)
+    batch.add_argument('--workers', type=int, nargs='*', help='worker counts to try')
+    batch.add_argument('--recategorize', action='store_true',
+                       help='also re-apply category rules to rule-categorized rows')
+    batch.set_defaults(func=bench_batch)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()